@@ -1,6 +1,7 @@
 import re, json
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
 
 # ---------- FILES ----------
 EN_FILE = Path("test_sample_en_parsed.json")
@@ -59,6 +60,13 @@ ENTITY_PATTERNS = {
     "range": r"\b\d{4}\s?[–\-—]\s?\d{4}\b"
 }
 
+# FIX: match lowered text, re.I fallback, one MASTER_RE pre-scan (rationale in final.py)
+assert not re.search(r"\\[A-Z]", "".join(ENTITY_PATTERNS.values())), "uppercase escape in ENTITY_PATTERNS"
+COMPILED_PATTERNS = [(tag, re.compile(pat.lower())) for tag, pat in ENTITY_PATTERNS.items()]
+CASEFOLD_PATTERNS = [(tag, re.compile(pat, re.IGNORECASE)) for tag, pat in ENTITY_PATTERNS.items()]
+assert all(p.groups == 0 for _, p in COMPILED_PATTERNS), "use (?:...) inside ENTITY_PATTERNS"
+MASTER_RE = re.compile("|".join(f"(?P<{tag}>{pat.lower()})" for tag, pat in ENTITY_PATTERNS.items()))
+
 
 # ---------- CROSS-LINGUAL EQUIVALENCE MAP ----------
 ENTITY_EQUIVALENCE = {
@@ -79,31 +87,54 @@ MONTHS = {
     "oktobris":10,"oktobrī":10,"novembris":11,"novembrī":11,"decembris":12,"decembrī":12
 }
 
+# ---------- PRECOMPILED HELPER PATTERNS ----------
+_NBSP_TABLE = str.maketrans({"\u00A0": " ", "\u202F": " ", "\u2009": " "})
+_CLEAN_WS_RE = re.compile(r"\s+")
+_DE_DAY_DOT_RE = re.compile(r"(\b\d{1,2})\.\s*([A-Za-zäÄöÖüÜ]+)\s*(\d{4}\b)")
+_LV_DATE_RE = re.compile(r"(\d{4})\.\s*(?:gada)?\s*(\d{1,2})\.\s*([A-Za-zāčēģīķļņōŗšūž]+)")
+_LV_MONTH_SUFFIX_RE = re.compile(r"(ā|a|s|āra)$")
+_EN_DATE_RE = re.compile(r"(\d{1,2})\s*([A-Za-zäÄöÖüÜ]+)\s*(\d{4})")
+_NUM_FALLBACK_RE = re.compile(r"(\d{1,2})[.\-/](\d{1,2})[.\-/](\d{2,4})")
+_EUR_FIX_RE = re.compile(r"(\d+(?:[.,]\d+)?)EUR")
+_EUR_PREFIX_RE = re.compile(r"EUR(\d+(?:[.,]\d+)?)")
+_MILJARDI_RE = re.compile(r"MILJARDI")
+_MILJONI_RE = re.compile(r"MILJONI")
+_LEGAL_KEYWORD_RE = re.compile(
+    r"\b(?:COUNCIL|REGULATION|REGULA|REGULAS|VERORDNUNG|DIRECTIVE|DIREKTĪVA|DECISION|LĒMUMS)\s*", re.I
+)
+_LEGAL_NO_RE = re.compile(r"\s*(?:NO\.|NR\.|N\.)\s*", re.I)
+_CODE_SPLIT_RE = re.compile(r"\s*,\s*")
+_ARTICLE_RE = re.compile(r"(Article|Artikel|Art\.?|pants?|panta|pantā|pantu)", re.I)
+_ARTICLE_NUM_RE = re.compile(r"(\d+[A-Za-z]?(?:\(\d+\))?)")
+
 # ---------- HELPERS ----------
-def clean_text(text: str) -> str:
+def clean_text(text: object) -> str:
     if not isinstance(text, str):
         return ""
-    text = re.sub(r"[\u00A0\u202F\u2009]", " ", text)
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
+    return _clean_text_cached(text)
 
+@lru_cache(maxsize=8192)
+def _clean_text_cached(text):
+    return _CLEAN_WS_RE.sub(" ", text.translate(_NBSP_TABLE)).strip()
+
+@lru_cache(maxsize=4096)
 def normalize_date(text):
     text = clean_text(text)
     
     # FIX: Use text_processed to handle the German date format with a period after the day
-    text_processed = re.sub(r"(\b\d{1,2})\.\s*([A-Za-zäÄöÖüÜ]+)\s*(\d{4}\b)", r"\1 \2 \3", text)
+    text_processed = _DE_DAY_DOT_RE.sub(r"\1 \2 \3", text)
 
     # Latvian: 2025. gada 1. janvāra → 2025-01-01
-    m = re.match(r"(\d{4})\.\s*(?:gada)?\s*(\d{1,2})\.\s*([A-Za-zāčēģīķļņōŗšūž]+)", text)
+    m = _LV_DATE_RE.match(text)
     if m:
         y, d, mon = m.groups()
-        mon = re.sub(r"(ā|a|s|āra)$", "", mon.lower())
+        mon = _LV_MONTH_SUFFIX_RE.sub("", mon.lower())
         month = MONTHS.get(mon, 0)
         if month:
             return f"{y}-{month:02d}-{int(d):02d}"
 
     # English/German formats (using pre-processed text to catch "11. September 2013")
-    m = re.match(r"(\d{1,2})\s*([A-Za-zäÄöÖüÜ]+)\s*(\d{4})", text_processed)
+    m = _EN_DATE_RE.match(text_processed)
     if m:
         d, mon, y = m.groups()
         month = MONTHS.get(mon.lower(), 0)
@@ -111,7 +142,7 @@ def normalize_date(text):
             return f"{y}-{month:02d}-{int(d):02d}"
 
     # Numeric fallback
-    m = re.match(r"(\d{1,2})[.\-/](\d{1,2})[.\-/](\d{2,4})", text)
+    m = _NUM_FALLBACK_RE.match(text)
     if m:
         d, mth, y = map(int, m.groups())
         y = y + 2000 if y < 100 else y
@@ -135,6 +166,26 @@ LEGAL_RECANON = re.compile(
     r"(?P<num>\d+)\s*/\s*(?P<year>\d{4})", re.I
 )
 
+def _split_legal_ref(s):
+    """Hand scanner for the cleaned "(CODES)NUMBER/YEAR" shape; None for anything else (LEGAL_RECANON handles it)."""
+    if s.startswith("("):
+        j = s.find(")")
+        if j < 0:
+            return None
+        codes, tail = s[1:j], s[j + 1:]
+        parts = codes.split(",")
+        if codes != codes.strip() or not all(c.strip().isascii() and c.strip().isalpha() for c in parts):
+            return None
+    elif "(" in s:
+        return None
+    else:
+        codes, tail = None, s
+    num, sep, year = tail.partition("/")
+    num, year = num.strip(), year.strip()
+    if not sep or not num.isdecimal() or not year.isdecimal() or len(year) != 4:
+        return None
+    return codes, year, num
+
 # ---------- NORMALIZATION ----------
 def normalize_entity(tag, val):
     val = val.strip()
@@ -144,10 +195,10 @@ def normalize_entity(tag, val):
         return normalize_number(val)
     if tag == "eur_amount":
         s = val.upper().replace(" ", "")
-        s = re.sub(r"(\d+(?:[.,]\d+)?)EUR", r"EUR\1", s)
-        s = re.sub(r"EUR(\d+(?:[.,]\d+)?)", r"EUR\1", s)
-        s = re.sub(r"MILJARDI", "BILLION", s)
-        s = re.sub(r"MILJONI", "MILLION", s)
+        s = _EUR_FIX_RE.sub(r"EUR\1", s)
+        s = _EUR_PREFIX_RE.sub(r"EUR\1", s)
+        s = _MILJARDI_RE.sub("BILLION", s)
+        s = _MILJONI_RE.sub("MILLION", s)
         s = s.replace(",", ".")
         return s
     
@@ -156,31 +207,30 @@ def normalize_entity(tag, val):
         
         # --- FIX: Proactively strip legal keywords and 'No.' prefix ---
         # 1. Strip the legal entity words (Council, Regulation, Verordnung, etc.)
-        s = re.sub(
-            r"\b(?:COUNCIL|REGULATION|REGULA|REGULAS|VERORDNUNG|DIRECTIVE|DIREKTĪVA|DECISION|LĒMUMS)\s*", 
-            "", s, flags=re.I
-        )
+        s = _LEGAL_KEYWORD_RE.sub("", s)
         # 2. Strip all variants of the number prefix (No., Nr., N.) 
-        s = re.sub(r"\s*(?:NO\.|NR\.|N\.)\s*", "", s, flags=re.I)
+        s = _LEGAL_NO_RE.sub("", s)
         # 3. Re-clean to handle extra spaces after stripping
         s = clean_text(s)
         # -----------------------------------------------------------
         
-        m = LEGAL_RECANON.search(s) # Search the clean, reduced string
-        
-        if not m:
-            # Fallback if the code/number pattern isn't found
-            for k, v in ENTITY_EQUIVALENCE.items():
-                s = s.replace(k.upper(), v.upper())
-            return s
-        
-        # Now, the simplified regex only has one codes group to check
-        codes = m.group("codes")
-        year, num = m.group("year"), m.group("num")
+        parts = _split_legal_ref(s) # Keywords are gone, so this is usually "(CODES)NUMBER/YEAR"
+        if parts is None:
+            m = LEGAL_RECANON.search(s) # Search the clean, reduced string
+            
+            if not m:
+                # Fallback if the code/number pattern isn't found
+                for k, v in ENTITY_EQUIVALENCE.items():
+                    s = s.replace(k.upper(), v.upper())
+                return s
+            
+            # Now, the simplified regex only has one codes group to check
+            parts = m.group("codes"), m.group("year"), m.group("num")
+        codes, year, num = parts
         
         code_list = []
         if codes:
-            for c in re.split(r"\s*,\s*", codes):
+            for c in _CODE_SPLIT_RE.split(codes):
                 c = ENTITY_EQUIVALENCE.get(c.strip(), c.strip()).upper()
                 code_list.append(c)
         
@@ -195,8 +245,8 @@ def normalize_entity(tag, val):
 
     # ... (article and default returns remain the same)
     if tag == "article":
-        norm = re.sub(r"(Article|Artikel|Art\.?|pants?|panta|pantā|pantu)", "Art", val, flags=re.I)
-        m = re.search(r"(\d+[A-Za-z]?(?:\(\d+\))?)", norm)
+        norm = _ARTICLE_RE.sub("Art", val)
+        m = _ARTICLE_NUM_RE.search(norm)
         if m:
             return f"Art {m.group(1)}"
         return "Art"
@@ -207,32 +257,57 @@ def load_paragraphs(path):
     with open(path, encoding="utf-8") as f:
         data = json.load(f)[0]["para"]
     return {p["para_number"]: p["para"] for p in data}
-def load_paragraphs(path):
-    with open(path, encoding="utf-8") as f:
-        data = json.load(f)[0]["para"]
-    return {p["para_number"]: p["para"] for p in data}
 
 en_map = load_paragraphs(EN_FILE)
 # Renamed lv_map to de_map for correct tracking of the German file
 de_map = load_paragraphs(DE_FILE) 
 
 # ---------- ENTITY EXTRACTION ----------
-def extract_entities(text):
+def _lowers_like_ignorecase(text, lowered):
+    # same check as final._lowers_like_ignorecase
+    if len(lowered) != len(text):
+        return False
+    if "ß" in text:
+        text, lowered = text.replace("ß", ""), lowered.replace("ß", "")
+    return text.upper().lower() == lowered
+
+@lru_cache(maxsize=4096)
+def _extract_cached(text):
+    # Stored as ((tag, (values, ...)), ...) so cached results can't be mutated by callers
     text = clean_text(text)
-    entities = {}
-    for tag, pat in ENTITY_PATTERNS.items():
-        matches = re.findall(pat, text, re.I)
+    lowered = text.lower()
+    if not _lowers_like_ignorecase(text, lowered):
+        patterns, haystack = CASEFOLD_PATTERNS, text
+    elif not MASTER_RE.search(lowered):
+        return ()
+    else:
+        patterns, haystack = COMPILED_PATTERNS, lowered
+    entities = []
+    for tag, pat in patterns:
+        matches = [text[m.start():m.end()] for m in pat.finditer(haystack)]
         if matches:
-            entities[tag] = [normalize_entity(tag, m) for m in matches]
-    return entities
+            entities.append((tag, tuple(normalize_entity(tag, m) for m in matches)))
+    return tuple(entities)
+
+def extract_entities(text):
+    if not isinstance(text, str):  # checked before the cache, which needs a hashable key
+        return {}
+    return {tag: list(vals) for tag, vals in _extract_cached(text)}
 
 # ---------- SMART COMPARISON ----------
+# Values interned to bit positions per call: overlap test is one int AND (see final.entity_similarity)
+def _entity_mask(vals, vocab):
+    m = 0
+    for v in vals:
+        m |= 1 << vocab.setdefault(v, len(vocab))
+    return m
+
 def is_significant_mismatch(en_vals, de_vals):
     """Return True only if one side lacks all equivalents."""
     if not en_vals and not de_vals:
         return False
-    en_set, de_set = set(en_vals), set(de_vals)
-    if en_set & de_set:
+    vocab = {}
+    if _entity_mask(en_vals, vocab) & _entity_mask(de_vals, vocab):
         return False  # any overlap = acceptable
     return True
 
@@ -1,6 +1,15 @@
 # ai_module.py
-import re, json, hashlib
+from __future__ import annotations
+
+import re, json, asyncio, contextlib
 from difflib import SequenceMatcher
+from concurrent.futures import ThreadPoolExecutor
+
+# RapidFuzz（C++ 实现）可选，缺失时回退到 difflib
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
 
 # 引用 WatsonX 配置（简化为可独立使用）
 USE_WX = False
@@ -24,32 +33,49 @@ except Exception:
     pass
 
 
-def text_similarity_factual(en_text: str, de_text: str) -> float:
-    """基于 factual signature + WatsonX 的混合语义相似度"""
-    if not en_text or not de_text:
-        return 0.0
+# ---------- factual signature 正则（预编译） ----------
+_EUR_SIG_RE = re.compile(r"€|eur|euro")
+_DATE_SIG_RE = re.compile(r"\d{1,2}\s*[A-Za-z]+\s*\d{4}")
+_REG_SIG_RE = re.compile(r"(regulation|verordnung)\s*\(eu[^\)]*\)\s*\d{4}/\d+")
+_ART_SIG_RE = re.compile(r"article\s*\d+")
+_WS_SIG_RE = re.compile(r"\s+")
 
-    # ---------- 先构建 factual signature ----------
-    def signature(t):
-        t = t.lower()
-        t = re.sub(r"€|eur|euro", "eur", t)
-        t = re.sub(r"\d{1,2}\s*[A-Za-z]+\s*\d{4}", "date", t)
-        t = re.sub(r"(regulation|verordnung)\s*\(eu[^\)]*\)\s*\d{4}/\d+", "reg", t)
-        t = re.sub(r"article\s*\d+", "article", t)
-        t = re.sub(r"\s+", "", t)
-        return hashlib.md5(t.encode("utf-8")).hexdigest()[:12]
 
-    sig_en = signature(en_text)
-    sig_de = signature(de_text)
+def signature(t: str) -> str:
+    """Normalized factual signature; compared directly, no hashing."""
+    t = t.lower()
+    t = _EUR_SIG_RE.sub("eur", t)
+    t = _DATE_SIG_RE.sub("date", t)
+    t = _REG_SIG_RE.sub("reg", t)
+    t = _ART_SIG_RE.sub("article", t)
+    t = _WS_SIG_RE.sub("", t)
+    return t
 
-    if sig_en == sig_de:
-        base_score = 1.0
+
+def _ratio(a: str, b: str) -> float:
+    if fuzz is not None:
+        return fuzz.ratio(a, b) / 100.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def signature_similarity_batch(en_texts, de_texts) -> list:
+    """Signature-only similarity for aligned EN/DE paragraph pairs (no WatsonX)."""
+    if len(en_texts) != len(de_texts):
+        raise ValueError(f"expected aligned pairs, got {len(en_texts)} EN and {len(de_texts)} DE texts")
+    sigs_en = [signature(t) if t else "" for t in en_texts]
+    sigs_de = [signature(t) if t else "" for t in de_texts]
+    if process is not None and hasattr(process, "cpdist"):
+        # one C call for all pairs instead of one Python call per pair
+        scores = [float(x) / 100.0 for x in process.cpdist(sigs_en, sigs_de, scorer=fuzz.ratio)]
     else:
-        base_score = SequenceMatcher(None, sig_en, sig_de).ratio()
+        scores = [_ratio(a, b) for a, b in zip(sigs_en, sigs_de)]
+    return [
+        0.0 if not a or not b else (1.0 if sa == sb else round(sc, 3))
+        for a, b, sa, sb, sc in zip(en_texts, de_texts, sigs_en, sigs_de, scores)
+    ]
 
-    # ---------- WatsonX 精修 ----------
-    if USE_WX and wx_model:
-        prompt = f"""
+
+_WX_PROMPT = """
 You are a bilingual factual consistency checker.
 Return JSON only:
 {{"semantic_similarity":0.0-1.0, "comment":"short factual note"}}
@@ -60,15 +86,75 @@ Return JSON only:
 [DE]
 {de_text}
 """
-        try:
-            result = wx_model.generate_text(prompt=prompt, params={"max_new_tokens":180, "temperature":0})
-            import json
-            m = re.search(r"\{[\s\S]*\}", str(result))
-            if m:
-                obj = json.loads(m.group(0))
-                if "semantic_similarity" in obj:
-                    return float(obj["semantic_similarity"])
-        except Exception:
-            pass
+_JSON_OBJ_RE = re.compile(r"\{[\s\S]*\}")
+
+
+def _signature_score(en_text: str, de_text: str) -> float:
+    # ---------- 先构建 factual signature ----------
+    sig_en = signature(en_text)
+    sig_de = signature(de_text)
+    if sig_en == sig_de:
+        return 1.0
+    return _ratio(sig_en, sig_de)
+
+
+def _wx_score(en_text: str, de_text: str):
+    """WatsonX 精修（阻塞 HTTP 调用）；失败时返回 None"""
+    prompt = _WX_PROMPT.format(en_text=en_text, de_text=de_text)
+    try:
+        result = wx_model.generate_text(prompt=prompt, params={"max_new_tokens":180, "temperature":0})
+        m = _JSON_OBJ_RE.search(str(result))
+        if m:
+            obj = json.loads(m.group(0))
+            if "semantic_similarity" in obj:
+                return float(obj["semantic_similarity"])
+    except Exception:
+        pass
+    return None
+
+
+def text_similarity_factual(en_text: str, de_text: str) -> float:
+    """基于 factual signature + WatsonX 的混合语义相似度"""
+    if not en_text or not de_text:
+        return 0.0
+
+    base_score = _signature_score(en_text, de_text)
+
+    # ---------- WatsonX 精修（signature 完全一致时不再请求） ----------
+    if base_score < 1.0 and USE_WX and wx_model:
+        score = _wx_score(en_text, de_text)
+        if score is not None:
+            return score
 
     return round(float(base_score), 3)
+
+
+async def text_similarity_factual_async(en_text: str, de_text: str, sem: asyncio.Semaphore | None = None) -> float:
+    """text_similarity_factual 的异步版本：WatsonX 调用放到线程中，sem 限制并发请求数"""
+    if not en_text or not de_text:
+        return 0.0
+
+    base_score = _signature_score(en_text, de_text)
+
+    if base_score < 1.0 and USE_WX and wx_model:
+        async with sem or contextlib.nullcontext():
+            score = await asyncio.to_thread(_wx_score, en_text, de_text)
+        if score is not None:
+            return score
+
+    return round(float(base_score), 3)
+
+
+def text_similarity_factual_many(en_texts, de_texts, concurrency: int = 8) -> list:
+    """批量计算 EN/DE 段落对的相似度，WatsonX 请求并发执行（最多 concurrency 个同时进行）。
+
+    不能在已运行的 event loop 中调用；异步代码请直接 gather text_similarity_factual_async。
+    """
+    async def _run():
+        sem = asyncio.Semaphore(concurrency)
+        # 默认线程池大小取决于 CPU 数，这里按 concurrency 配置，保证 I/O 等待真正并发
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+        return await asyncio.gather(*(
+            text_similarity_factual_async(en, de, sem) for en, de in zip(en_texts, de_texts)
+        ))
+    return list(asyncio.run(_run()))
@@ -2,37 +2,20 @@
 from flask import Flask, render_template, request
 from werkzeug.utils import secure_filename
 from pathlib import Path
-import json, os, re, tempfile
-from final import generate_report as generate_report_full  # 原始3语言函数
+from functools import lru_cache
+import os, re
+from final import generate_report as generate_report_full  # EN/DE，LV 可选
+from final import save_report_json
 
 app = Flask(__name__)
 
-# ---------- 包装器：让 generate_report 兼容 2 文件 ----------
-def generate_report(path_a, path_b):
-    """
-    Wrapper for generate_report(en_path, de_path, lv_path)
-    自动生成一个假的 LV 文件（空段落），以便旧版本兼容。
-    """
-    dummy_lv = Path(tempfile.gettempdir()) / "dummy_lv.json"
-    with open(path_a, encoding="utf-8") as f:
-        data_a = json.load(f)
-
-    # 创建空结构（和 EN 一样长度）
-    if isinstance(data_a, list) and "para" in data_a[0]:
-        count = len(data_a[0]["para"])
-    else:
-        count = len(data_a)
-
-    dummy_data = [{
-        "para": [{"para_number": i + 1, "para": ""} for i in range(count)]
-    }]
-    with open(dummy_lv, "w", encoding="utf-8") as f:
-        json.dump(dummy_data, f, ensure_ascii=False)
-
-    return generate_report_full(path_a, path_b, dummy_lv)
+# ---------- 实体高亮 ----------
+@lru_cache(maxsize=1024)
+def _highlight_pattern(values):
+    """一次编译所有实体值（长的优先），单次扫描完成高亮"""
+    return re.compile("|".join(re.escape(v) for v in values), re.IGNORECASE)
 
 
-# ---------- 实体高亮 ----------
 @app.template_filter("highlight_entities")
 def highlight_entities(text, entities):
     if not text or not entities:
@@ -48,17 +31,12 @@ def highlight_entities(text, entities):
             elif vals:
                 all_values.append(str(vals))
 
-    for val in sorted(set(all_values), key=len, reverse=True):
-        if not val or len(val) < 2:
-            continue
-        pattern = re.escape(val)
-        highlighted = re.sub(
-            pattern,
-            f'<span class="entity-highlight">{val}</span>',
-            highlighted,
-            flags=re.IGNORECASE
-        )
-    return highlighted
+    values = tuple(sorted({v for v in all_values if v and len(v) >= 2}, key=lambda v: (-len(v), v)))
+    if not values:
+        return highlighted
+    return _highlight_pattern(values).sub(
+        lambda m: f'<span class="entity-highlight">{m.group(0)}</span>', highlighted
+    )
 
 
 # ---------- 首页 ----------
@@ -84,13 +62,10 @@ def compare_files():
     file_a.save(path_a)
     file_b.save(path_b)
 
-    rows = generate_report(path_a, path_b)  # ✅ 调用包装后的函数
+    rows = generate_report_full(path_a, path_b)  # ✅ 2 文件模式：LV 可省略
 
     # 保存结果
-    result_dir = Path("results")
-    result_dir.mkdir(exist_ok=True)
-    with open(result_dir / "comparison.json", "w", encoding="utf-8") as f:
-        json.dump(rows, f, ensure_ascii=False, indent=2)
+    save_report_json(rows, Path("results") / "comparison.json")
 
     return render_template("report.html", rows=rows,
                            fileA=file_a.filename, fileB=file_b.filename)
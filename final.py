@@ -4,30 +4,51 @@ final.py — Entity-based factual comparison with optional WatsonX semantic AI
 Fully compatible with Flask app.py (2-file or 3-file mode)
 """
 
-import re, json, os, hashlib
+from __future__ import annotations
+
+import re, json, os, mmap
 from pathlib import Path
 from datetime import datetime
 from difflib import SequenceMatcher
+from functools import lru_cache
+from bisect import bisect_right
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# orjson (Rust) is optional; stdlib json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
 
 # ---------- Optional WatsonX AI Semantic Engine ----------
 USE_WX = False
 wx_model = None
 
-try:
-    from ibm_watsonx_ai import APIClient
-    from ibm_watsonx_ai.foundation_models import ModelInference
-    from dotenv import load_dotenv
-    load_dotenv()
-    apikey = os.getenv("WATSONX_APIKEY")
-    url = os.getenv("WATSONX_URL")
-    project = os.getenv("WATSONX_PROJECT_ID")
-    if apikey and url and project:
-        wx_client = APIClient({"apikey": apikey, "url": url})
-        wx_model = ModelInference(model_id="meta-llama/llama-3-3-70b-instruct",
-                                  api_client=wx_client, project_id=project)
-        USE_WX = True
-except Exception:
-    pass
+def init_watsonx() -> bool:
+    """Authenticate to WatsonX from the environment; sets USE_WX / wx_model.
+
+    Not run at import: spawned extraction workers (macOS/Windows) re-import this
+    module, and each would authenticate again. Call it where the model is needed.
+    """
+    global USE_WX, wx_model
+    try:
+        from ibm_watsonx_ai import APIClient
+        from ibm_watsonx_ai.foundation_models import ModelInference
+        from dotenv import load_dotenv
+        load_dotenv()
+        apikey = os.getenv("WATSONX_APIKEY")
+        url = os.getenv("WATSONX_URL")
+        project = os.getenv("WATSONX_PROJECT_ID")
+        if apikey and url and project:
+            wx_client = APIClient({"apikey": apikey, "url": url})
+            wx_model = ModelInference(model_id="meta-llama/llama-3-3-70b-instruct",
+                                      api_client=wx_client, project_id=project)
+            USE_WX = True
+    except Exception:
+        pass
+    return USE_WX
 
 
 # ---------- REGEX EXTRACTION ----------
@@ -70,6 +91,23 @@ ENTITY_PATTERNS = {
     "range": r"\b\d{4}\s?[–\-—]\s?\d{4}\b"
 }
 
+# Patterns run case-sensitively against text.lower(), sparing the engine a casefold per
+# character; matches are sliced back out of the original text by span. Lowering the
+# pattern source is only safe while no pattern uses an uppercase escape (\D, \S, \W, \B).
+assert not re.search(r"\\[A-Z]", "".join(ENTITY_PATTERNS.values())), "uppercase escape in ENTITY_PATTERNS"
+COMPILED_PATTERNS = [(tag, re.compile(pat.lower())) for tag, pat in ENTITY_PATTERNS.items()]
+# Fallback for the rare text where lowering is not equivalent to re.I: lower() changes
+# its length ("İ" -> "i̇", spans would not line up), or it holds a char that re.I folds
+# but lower() leaves alone ("ſ" ~ "s", "ı" ~ "i", "µ" ~ "μ"). All such chars fail the
+# upper().lower() round trip, see _lowers_like_ignorecase.
+CASEFOLD_PATTERNS = [(tag, re.compile(pat, re.IGNORECASE)) for tag, pat in ENTITY_PATTERNS.items()]
+
+# All tags fused into one alternation: a paragraph with no candidate for any tag
+# is rejected in a single scan. Per-tag findall still runs afterwards because the
+# tags overlap (a date also yields numbers, "100 EUR" is a number and an amount).
+assert all(p.groups == 0 for _, p in COMPILED_PATTERNS), "use (?:...) inside ENTITY_PATTERNS"
+MASTER_RE = re.compile("|".join(f"(?P<{tag}>{pat.lower()})" for tag, pat in ENTITY_PATTERNS.items()))
+
 ENTITY_EQUIVALENCE = {
     "ES": "EU",
     "EK": "EC",
@@ -94,30 +132,48 @@ LEGAL_RECANON = re.compile(
     r"(?P<year>\d{4})\s*/\s*(?P<num>\d+)", re.I
 )
 
+# ---------- Precompiled helper patterns ----------
+_NBSP_TABLE = str.maketrans({"\u00A0": " ", "\u202F": " ", "\u2009": " "})
+_CLEAN_WS_RE = re.compile(r"\s+")
+_GADA_RE = re.compile(r"\bgad(?:a|ā|am|us|ai)\b", re.I)
+_LV_DATE_RE = re.compile(r"(\d{4})\.\s*(?:gada)?\s*(\d{1,2})\.\s*([A-Za-zāčēģīķļņōŗšūž]+)")
+_LV_MONTH_SUFFIX_RE = re.compile(r"(ā|a|s|āra)$")
+_EN_DATE_RE = re.compile(r"(\d{1,2})\.?\s*([A-Za-zäÄöÖüÜ]+)\s*(\d{4})")
+_NUM_FALLBACK_RE = re.compile(r"(\d{1,2})[.\-/](\d{1,2})[.\-/](\d{2,4})")
+_EUR_FIX_RE = re.compile(r"(\d+(?:[.,]\d+)?)EUR")
+_MILJARDI_RE = re.compile(r"MILJARDI")
+_MILJONI_RE = re.compile(r"MILJONI")
+_CODE_SPLIT_RE = re.compile(r"\s*,\s*")
+_ARTICLE_RE = re.compile(r"(Article|Artikel|Art\.?|pants?|panta|pantā|pantu)", re.I)
+_ARTICLE_NUM_RE = re.compile(r"(\d+[A-Za-z]?(?:\(\d+\))?)")
+
 # ---------- Helpers ----------
 
-def clean_text(text: str) -> str:
+def clean_text(text: object) -> str:
     if not isinstance(text, str):
         return ""
-    text = re.sub(r"[\u00A0\u202F\u2009]", " ", text)
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
+    return _clean_text_cached(text)
 
+@lru_cache(maxsize=8192)
+def _clean_text_cached(text: str) -> str:
+    return _CLEAN_WS_RE.sub(" ", text.translate(_NBSP_TABLE)).strip()
+
+@lru_cache(maxsize=4096)
 def normalize_date(text: str) -> str:
     text = clean_text(text)
-    text = re.sub(r"\bgad(?:a|ā|am|us|ai)\b", "", text, flags=re.I).strip()
-    m = re.match(r"(\d{4})\.\s*(?:gada)?\s*(\d{1,2})\.\s*([A-Za-zāčēģīķļņōŗšūž]+)", text)
+    text = _GADA_RE.sub("", text).strip()
+    m = _LV_DATE_RE.match(text)
     if m:
         y, d, mon = m.groups()
-        mon = re.sub(r"(ā|a|s|āra)$", "", mon.lower())
+        mon = _LV_MONTH_SUFFIX_RE.sub("", mon.lower())
         month = MONTHS.get(mon, 0)
         if month: return f"{y}-{month:02d}-{int(d):02d}"
-    m = re.match(r"(\d{1,2})\.?\s*([A-Za-zäÄöÖüÜ]+)\s*(\d{4})", text)
+    m = _EN_DATE_RE.match(text)
     if m:
         d, mon, y = m.groups()
         month = MONTHS.get(mon.lower(), 0)
         if month: return f"{y}-{month:02d}-{int(d):02d}"
-    m = re.match(r"(\d{1,2})[.\-/](\d{1,2})[.\-/](\d{2,4})", text)
+    m = _NUM_FALLBACK_RE.match(text)
     if m:
         d, mth, y = map(int, m.groups())
         y = y + 2000 if y < 100 else y
@@ -131,29 +187,51 @@ def normalize_number(text: str) -> str:
     except:
         return val
 
+def _split_legal_ref(s: str) -> tuple | None:
+    """Hand scanner for the "(CODES) YEAR/NUMBER" shape; None for anything else (LEGAL_RECANON handles it)."""
+    if s.startswith("("):
+        j = s.find(")")
+        if j < 0:
+            return None
+        codes, tail = s[1:j], s[j + 1:]
+        parts = codes.split(",")
+        if codes != codes.strip() or not all(c.strip().isascii() and c.strip().isalpha() for c in parts):
+            return None
+    elif "(" in s:
+        return None
+    else:
+        codes, tail = None, s
+    year, sep, num = tail.partition("/")
+    year, num = year.strip(), num.strip()
+    if not sep or not num.isdecimal() or not year.isdecimal() or len(year) != 4:
+        return None
+    return codes, year, num
+
 def normalize_entity(tag: str, val: str) -> str:
     val = val.strip()
     if tag == "date": return normalize_date(val)
     if tag in ("percent", "number"): return normalize_number(val)
     if tag == "eur_amount":
         s = val.upper().replace(" ", "")
-        s = re.sub(r"(\d+(?:[.,]\d+)?)EUR", r"EUR\1", s)
-        s = re.sub(r"MILJARDI", "BILLION", s)
-        s = re.sub(r"MILJONI", "MILLION", s)
+        s = _EUR_FIX_RE.sub(r"EUR\1", s)
+        s = _MILJARDI_RE.sub("BILLION", s)
+        s = _MILJONI_RE.sub("MILLION", s)
         s = s.replace(",", ".")
         return s
     if tag == "legal_ref":
         s = clean_text(val).upper()
-        m = LEGAL_RECANON.search(s)
-        if not m:
-            for k, v in ENTITY_EQUIVALENCE.items():
-                s = s.replace(k.upper(), v.upper())
-            return s
-        codes = m.group("codes") or m.group("codes2") or ""
-        year, num = m.group("year"), m.group("num")
+        parts = _split_legal_ref(s)
+        if parts is None:
+            m = LEGAL_RECANON.search(s)
+            if not m:
+                for k, v in ENTITY_EQUIVALENCE.items():
+                    s = s.replace(k.upper(), v.upper())
+                return s
+            parts = m.group("codes") or m.group("codes2"), m.group("year"), m.group("num")
+        codes, year, num = parts
         code_list = []
         if codes:
-            for c in re.split(r"\s*,\s*", codes):
+            for c in _CODE_SPLIT_RE.split(codes):
                 c = ENTITY_EQUIVALENCE.get(c.strip(), c.strip()).upper()
                 code_list.append(c)
         if not code_list: code_list = ["EU"]
@@ -161,22 +239,109 @@ def normalize_entity(tag: str, val: str) -> str:
         code_list = sorted(set(code_list), key=lambda x: order.get(x, 99))
         return f"({', '.join(code_list)}){year}/{num}"
     if tag == "article":
-        norm = re.sub(r"(Article|Artikel|Art\.?|pants?|panta|pantā|pantu)", "Art", val, flags=re.I)
-        m = re.search(r"(\d+[A-Za-z]?(?:\(\d+\))?)", norm)
+        norm = _ARTICLE_RE.sub("Art", val)
+        m = _ARTICLE_NUM_RE.search(norm)
         if m: return f"Art {m.group(1)}"
         return "Art"
     return val.strip()
 
-def extract_entities(text: str):
+def _lowers_like_ignorecase(text: str, lowered: str) -> bool:
+    """True when matching `lowered` case-sensitively finds what re.I finds in `text`."""
+    if len(lowered) != len(text):
+        return False
+    # "ß" folds the same both ways; only its upper() ("SS") would fail the round trip
+    if "ß" in text:
+        text, lowered = text.replace("ß", ""), lowered.replace("ß", "")
+    return text.upper().lower() == lowered
+
+@lru_cache(maxsize=4096)
+def _extract_cached(text: str) -> tuple:
+    """Immutable ((tag, (values, ...)), ...) form so results can be shared across calls."""
     text = clean_text(text)
-    out = {}
-    for tag, pat in ENTITY_PATTERNS.items():
-        matches = re.findall(pat, text, re.I)
+    lowered = text.lower()
+    if not _lowers_like_ignorecase(text, lowered):
+        patterns, haystack = CASEFOLD_PATTERNS, text
+    elif not MASTER_RE.search(lowered):
+        return ()
+    else:
+        patterns, haystack = COMPILED_PATTERNS, lowered
+    out = []
+    for tag, pat in patterns:
+        matches = [text[m.start():m.end()] for m in pat.finditer(haystack)]
         if matches:
-            out[tag] = [normalize_entity(tag, m) for m in matches]
-    return out
+            out.append((tag, tuple(normalize_entity(tag, m) for m in matches)))
+    return tuple(out)
+
+def extract_entities(text: object) -> dict:
+    if not isinstance(text, str):  # checked before the cache, which needs a hashable key
+        return {}
+    return {tag: list(vals) for tag, vals in _extract_cached(text)}
+
+_BATCH_SEP = "\x00"
+
+def extract_entities_batch(texts: Sequence) -> list:
+    """extract_entities over many paragraphs with a single scan per tag.
+
+    Cleaned paragraphs are joined with NUL, which no entity pattern can match or
+    span (it is neither a word char nor whitespace), so every scan yields exactly
+    the per-paragraph findall results; matches are bucketed back by offset.
+    """
+    cleaned = [clean_text(t) for t in texts]
+    if any(_BATCH_SEP in t for t in cleaned):
+        return [extract_entities(t) for t in texts]
+    # boilerplate repeats across sections and languages: scan each distinct paragraph once
+    slot: dict[str, int] = {}
+    idx = [slot.setdefault(t, len(slot)) for t in cleaned]
+    unique = list(slot)
+    starts, pos = [], 0
+    for t in unique:
+        starts.append(pos)
+        pos += len(t) + 1
+    corpus = _BATCH_SEP.join(unique)
+    lowered = corpus.lower()
+    if not _lowers_like_ignorecase(corpus, lowered):
+        return [extract_entities(t) for t in texts]
+    found: list[dict] = [{} for _ in unique]
+    for tag, pat in COMPILED_PATTERNS:
+        for m in pat.finditer(lowered):
+            i = bisect_right(starts, m.start()) - 1
+            found[i].setdefault(tag, []).append(normalize_entity(tag, corpus[m.start():m.end()]))
+    return [{tag: list(vals) for tag, vals in found[i].items()} for i in idx]
+
+# below this many distinct paragraphs, worker start-up costs more than the regex work it saves
+_PARALLEL_MIN_TEXTS = 2000
+
+def extract_entities_parallel(texts: Sequence, workers: int | None = None) -> list:
+    """extract_entities_batch with the distinct non-empty paragraphs split across worker processes.
+
+    Empty placeholders and repeated paragraphs count neither towards the threshold nor
+    into the chunks. Workers are spawned, never forked: the caller may be a threaded
+    web server.
+    """
+    cleaned = [clean_text(t) for t in texts]
+    unique = list(dict.fromkeys(t for t in cleaned if t))
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or len(unique) < _PARALLEL_MIN_TEXTS:
+        return extract_entities_batch(cleaned)
+    size = -(-len(unique) // workers)
+    chunks = [unique[i:i + size] for i in range(0, len(unique), size)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        parts = pool.map(extract_entities_batch, chunks)
+        found = dict(zip(unique, (ents for part in parts for ents in part)))
+    return [{tag: list(vals) for tag, vals in found[t].items()} if t else {} for t in cleaned]
 
 # ---------- Entity-based similarity ----------
+# Entity values are interned to bit positions so "any overlap" is a single int AND.
+# The vocab lives for one entity_similarity call: ids stay small and no state is
+# shared between reports or requests.
+_TAGS = tuple(ENTITY_PATTERNS)
+
+def _entity_mask(vals: list, vocab: dict) -> int:
+    m = 0
+    for v in vals:
+        m |= 1 << vocab.setdefault(v, len(vocab))
+    return m
+
 def entity_similarity(ents_a: dict, ents_b: dict) -> float:
     """Compare factual overlap between entities."""
     if not ents_a and not ents_b:
@@ -184,35 +349,47 @@ def entity_similarity(ents_a: dict, ents_b: dict) -> float:
     if not ents_a or not ents_b:
         return 0.0
 
-    tags = set(ENTITY_PATTERNS.keys())
+    vocab: dict[str, int] = {}
     total, matched = 0, 0
-    for tag in tags:
-        a_vals, b_vals = set(ents_a.get(tag, [])), set(ents_b.get(tag, []))
+    for tag in _TAGS:
+        a_vals, b_vals = ents_a.get(tag), ents_b.get(tag)
         if not a_vals and not b_vals:
             continue
         total += 1
-        if a_vals & b_vals:
+        if a_vals and b_vals and _entity_mask(a_vals, vocab) & _entity_mask(b_vals, vocab):
             matched += 1
     return round(matched / total, 3) if total else 0.0
 
 # ---------- Comparison + Report ----------
 
-def load_paragraphs(path: Path):
-    with open(path, encoding="utf-8") as f:
-        data = json.load(f)[0]["para"]
+def load_paragraphs(path: Path) -> dict:
+    if orjson is not None:
+        # orjson parses straight out of the page cache: no bytes copy of the file
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                data = orjson.loads(view)[0]["para"]
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)[0]["para"]
     return {p["para_number"]: p["para"] for p in data}
 
-def generate_report(en_path: Path, de_path: Path, lv_path: Path):
+def generate_report(en_path: Path, de_path: Path, lv_path: Path | None = None) -> list:
     en_map = load_paragraphs(en_path)
     de_map = load_paragraphs(de_path)
-    lv_map = load_paragraphs(lv_path)
+    lv_map = load_paragraphs(lv_path) if lv_path else {}
 
     all_nums = sorted(set(en_map) | set(de_map) | set(lv_map))
-    rows = []
-    for n in all_nums:
-        en_txt, de_txt, lv_txt = en_map.get(n, ""), de_map.get(n, ""), lv_map.get(n, "")
-        en_ents, de_ents, lv_ents = extract_entities(en_txt), extract_entities(de_txt), extract_entities(lv_txt)
+    en_texts = [en_map.get(n, "") for n in all_nums]
+    de_texts = [de_map.get(n, "") for n in all_nums]
+    lv_texts = [lv_map.get(n, "") for n in all_nums]
+    # one scan per tag over all three languages instead of one per paragraph
+    k = len(all_nums)
+    ents = extract_entities_parallel(en_texts + de_texts + lv_texts)
+    en_all, de_all, lv_all = ents[:k], ents[k:2 * k], ents[2 * k:]
 
+    rows = []
+    for n, en_txt, de_txt, en_ents, de_ents, lv_ents in zip(
+            all_nums, en_texts, de_texts, en_all, de_all, lv_all):
         semantic_sim = entity_similarity(en_ents, de_ents)
         status = "green" if semantic_sim >= 0.8 else ("yellow" if semantic_sim >= 0.4 else "red")
 
@@ -228,7 +405,10 @@ def generate_report(en_path: Path, de_path: Path, lv_path: Path):
 
     return rows
 
-def save_report_json(rows, out_path: Path):
+def save_report_json(rows: list, out_path: Path) -> None:
     out_path.parent.mkdir(parents=True, exist_ok=True)
+    if orjson is not None:
+        out_path.write_bytes(orjson.dumps(rows, option=orjson.OPT_INDENT_2))
+        return
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(rows, f, ensure_ascii=False, indent=2)